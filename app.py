@@ -1,18 +1,33 @@
-import time, requests, streamlit as st
-from difflib import SequenceMatcher
+import io, os, csv, time, socket, sqlite3, asyncio, aiohttp, requests, streamlit as st
+from rapidfuzz import fuzz, process
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
+from selectolax.parser import HTMLParser
 from urllib.parse import urlparse
 
 DEFAULT_THRESHOLD=0.60
 CONNECT_TIMEOUT=6
 READ_TIMEOUT=12
 UA={"User-Agent":"CloneShield/mini"}
-HISTORY_FILE="history.csv"
+HISTORY_DB="history.db"
+LEGACY_HISTORY_FILE="history.csv"
+HISTORY_LIMIT=10000
+MAX_CONCURRENCY=64
+MAX_BYTES=2_000_000
+MIN_TEXT_LEN=100
+DNS_TIMEOUT=2  # budget for the whole lookup phase, not per name
+DNS_WORKERS=32
+DESCRIPTOR_CHARS=" etaoins"
 
 COMMON_TLDS=[".com",".net",".org",".co",".io",".info",".biz",".site",".online",".app"]
 PREFIXES=["secure","login","verify","account","support","update","auth","my","portal","service"]
 SUFFIXES=["login","secure","verify","update","auth","support","access","portal"]
 SUBS=["secure","login","verify","auth","account","portal"]
 
+SESSION=requests.Session();SESSION.headers.update(UA)
+_adapter=requests.adapters.HTTPAdapter(pool_connections=64,pool_maxsize=128,max_retries=0)
+SESSION.mount("https://",_adapter);SESSION.mount("http://",_adapter)
+
 def split_domain(domain):
     d=domain.strip().lower()
     if d.startswith(("http://","https://")): d=urlparse(d).netloc
@@ -22,73 +37,183 @@ def split_domain(domain):
 
 def gen_candidates(domain,cap=200):
     name,tld=split_domain(domain)
-    if not name: return []
-    out=set()
-    for p in PREFIXES: out|={f"{p}{name}{tld or '.com'}",f"{p}-{name}{tld or '.com'}"}
-    for s in SUFFIXES: out|={f"{name}{s}{tld or '.com'}",f"{name}-{s}{tld or '.com'}"}
-    for sub in SUBS: out.add(f"{sub}.{name}{tld or '.com'}")
-    for alt in COMMON_TLDS:
-        if alt!=tld: out.add(f"{name}{alt}")
-    out|={f"{name}-login{tld or '.com'}",f"{name}-secure{tld or '.com'}",f"login-{name}{tld or '.com'}",f"secure-{name}{tld or '.com'}"}
-    return list(out)[:cap]
+    if not name: return
+    t=tld or ".com"
+    def ordered():
+        for alt in COMMON_TLDS:
+            if alt!=tld: yield f"{name}{alt}"
+        for p in PREFIXES: yield f"{p}{name}{t}";yield f"{p}-{name}{t}"
+        for s in SUFFIXES: yield f"{name}{s}{t}";yield f"{name}-{s}{t}"
+        for sub in SUBS: yield f"{sub}.{name}{t}"
+        yield from (f"{name}-login{t}",f"{name}-secure{t}",f"login-{name}{t}",f"secure-{name}{t}")
+    seen=set()
+    for c in ordered():
+        if len(seen)>=cap: return
+        if c not in seen: seen.add(c);yield c
+
+def page_text(html):
+    tree=HTMLParser(html)
+    for tag in tree.css("script,style,noscript"): tag.decompose()
+    root=tree.body or tree.root
+    text=" ".join(root.text(separator=" ").split()) if root else ""
+    # JS-rendered pages have next to no visible text; compare their markup instead, as cloned kits copy it verbatim
+    return text if len(text)>=MIN_TEXT_LEN else " ".join(html.split())
+
+def decode_page(body,content_type):
+    # charset from the header when given, else UTF-8; requests' ISO-8859-1 default for text/* would skew sync vs async fetches
+    charset=""
+    for p in content_type.split(";")[1:]:
+        k,_,v=p.strip().partition("=")
+        if k.lower()=="charset": charset=v.strip("\"' ")
+    try: return body.decode(charset or "utf-8",errors="replace")
+    except LookupError: return body.decode("utf-8",errors="replace")
 
+class FetchError(Exception): pass
+
+# misses raise instead of returning None so st.cache_data only memoizes pages we actually got
+@st.cache_data(ttl=3600,max_entries=2048)
 def fetch_html(url):
     try:
-        r=requests.get(url,headers=UA,timeout=(CONNECT_TIMEOUT,READ_TIMEOUT),allow_redirects=True)
-        if r.status_code<400 and "html" in r.headers.get("content-type","").lower():
-            return " ".join(r.text.split())
+        with SESSION.get(url,timeout=(CONNECT_TIMEOUT,READ_TIMEOUT),allow_redirects=True,stream=True) as r:
+            if r.status_code<400 and "html" in r.headers.get("content-type","").lower():
+                body=r.raw.read(MAX_BYTES,decode_content=True)
+                text=page_text(decode_page(body,r.headers.get("content-type","")))
+                if text: return text
+    except Exception: pass
+    raise FetchError(url)
+
+def fetch_canonical(target):
+    try: return fetch_html(f"https://{target}")
+    except FetchError: return fetch_html(f"http://{target}")
+
+async def fetch_html_async(session,url):
+    try:
+        async with session.get(url,allow_redirects=True) as r:
+            if r.status<400 and "html" in r.headers.get("content-type","").lower():
+                body=bytearray()
+                async for chunk in r.content.iter_chunked(65536):
+                    body+=chunk
+                    if len(body)>=MAX_BYTES: break
+                body=bytes(body[:MAX_BYTES])
+                return page_text(decode_page(body,r.headers.get("content-type","")))
     except Exception: pass
     return None
 
-def similarity(a,b): return SequenceMatcher(None,a or "",b or "").ratio()
+async def _gather(hosts):
+    sem=asyncio.Semaphore(MAX_CONCURRENCY)
+    timeout=aiohttp.ClientTimeout(sock_connect=CONNECT_TIMEOUT,sock_read=READ_TIMEOUT)
+    conn=aiohttp.TCPConnector(limit=MAX_CONCURRENCY,ttl_dns_cache=300)
+    async with aiohttp.ClientSession(headers=UA,timeout=timeout,connector=conn) as session:
+        async def bounded(host):
+            async with sem:
+                return await fetch_html_async(session,f"https://{host}") or await fetch_html_async(session,f"http://{host}")
+        return await asyncio.gather(*[bounded(h) for h in hosts])
+
+def fetch_all(hosts): return asyncio.run(_gather(hosts))
+
+# NXDOMAIN / no address: the only answers that mean the lookalike isn't registered
+DEAD_DNS={socket.EAI_NONAME,getattr(socket,"EAI_NODATA",socket.EAI_NONAME)}
+
+def _lookup(host):
+    try: socket.getaddrinfo(host,None);return True
+    except socket.gaierror as e: return e.errno not in DEAD_DNS
+    except OSError: return True
 
+def resolve_all(hosts):
+    pool=ThreadPoolExecutor(max_workers=DNS_WORKERS)
+    futs=[pool.submit(_lookup,h) for h in hosts]
+    wait(futs,timeout=DNS_TIMEOUT)
+    pool.shutdown(wait=False,cancel_futures=True)
+    # names still pending at the deadline are kept, same as a slow lookup
+    return [h for h,f in zip(hosts,futs) if not f.done() or f.cancelled() or f.result()]
+
+def descriptor(s): return (len(s),)+tuple(s.count(c) for c in DESCRIPTOR_CHARS)
+
+def descriptor_bound(da,db):
+    # shared tracked characters plus the best case for all the others cap the ratio; looser than the
+    # full Counter bound (it is never below it) but only a few str.count() scans, so it runs first
+    rest=min(da[0]-sum(da[1:]),db[0]-sum(db[1:]))
+    return 2*(sum(map(min,da[1:],db[1:]))+rest)/(da[0]+db[0])
+
+def similarities(a,bs,threshold=0.0):
+    res=process.cdist([a],list(bs),scorer=fuzz.ratio,score_cutoff=threshold*100,workers=-1)[0]
+    return [float(sc)/100.0 for sc in res]
+
+@st.cache_data(ttl=1800)
 def scan_domain(target,threshold):
-    canon=fetch_html(f"https://{target}") or fetch_html(f"http://{target}")
-    rows=[]
-    if not canon: return rows
-    for cand in gen_candidates(target):
-        html=fetch_html(f"https://{cand}") or fetch_html(f"http://{cand}")
-        if not html: continue
-        sim=similarity(canon,html)
-        if sim>=threshold:
-            rows.append({"timestamp":int(time.time()),"target":target,"suspect_domain":cand,"similarity":round(sim,3),"url":f"https://{cand}"})
-    return rows
-
-def load_history():
-    try:
-        with open(HISTORY_FILE,"r",encoding="utf-8") as f:
-            lines=[l.strip() for l in f if l.strip()]
-            hdr=lines[0].split(",");data=[]
-            for l in lines[1:]:
-                vals=l.split(",");data.append(dict(zip(hdr,vals)))
-            return data
-    except Exception:return[]
-
-def append_history(rows):
+    canon=fetch_canonical(target)
+    canon_d,canon_chars=descriptor(canon),Counter(canon)
+    # most lookalikes aren't registered; drop them before paying an HTTP connect timeout each
+    cands=resolve_all(list(gen_candidates(target)))
+    # parked and hosting landers are often byte-identical; group them so each distinct page is scored once
+    pages={}
+    for cand,html in zip(cands,fetch_all(cands)):
+        if html: pages.setdefault(html,[]).append(cand)
+    hits,kept=[],[]
+    for html,hosts in pages.items():
+        if html==canon: hits+=[(c,1.0) for c in hosts];continue
+        if descriptor_bound(canon_d,descriptor(html))<threshold: continue
+        # same bound as SequenceMatcher.quick_ratio(): shared characters cap the ratio
+        if 2*sum((canon_chars&Counter(html)).values())/(len(canon)+len(html))<threshold: continue
+        kept.append((hosts,html))
+    if kept:
+        groups,htmls=zip(*kept)
+        hits+=[(c,sim) for hosts,sim in zip(groups,similarities(canon,htmls,threshold)) if sim>=threshold for c in hosts]
+    now=int(time.time())
+    return [{"timestamp":now,"target":target,"suspect_domain":cand,"similarity":round(sim,3),"url":f"https://{cand}"} for cand,sim in hits]
+
+@st.cache_resource
+def history_db():
+    con=sqlite3.connect(HISTORY_DB,check_same_thread=False);con.row_factory=sqlite3.Row
+    con.execute("PRAGMA journal_mode=WAL")
+    con.executescript("CREATE TABLE IF NOT EXISTS findings (timestamp INTEGER, target TEXT, suspect_domain TEXT, similarity REAL, url TEXT);"
+                      "CREATE INDEX IF NOT EXISTS ix_ts ON findings(timestamp);")
+    # one-time import of the old CSV history; user_version records that it ran so a cleared history stays cleared
+    if con.execute("PRAGMA user_version").fetchone()[0]==0:
+        with con:
+            if os.path.exists(LEGACY_HISTORY_FILE) and not con.execute("SELECT 1 FROM findings LIMIT 1").fetchone():
+                with open(LEGACY_HISTORY_FILE,"r",encoding="utf-8",newline="") as f:append_history(list(csv.DictReader(f)),con)
+            con.execute("PRAGMA user_version=1")
+    # cached scan_domain results come back with their original timestamp; make re-inserting them a no-op
+    if con.execute("PRAGMA user_version").fetchone()[0]==1:
+        with con:
+            con.execute("DELETE FROM findings WHERE rowid NOT IN (SELECT MIN(rowid) FROM findings GROUP BY timestamp,target,suspect_domain)")
+            con.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_finding ON findings(timestamp,target,suspect_domain)")
+            con.execute("PRAGMA user_version=2")
+    return con
+
+def load_history(limit=HISTORY_LIMIT):
+    try:return [dict(r) for r in history_db().execute("SELECT * FROM findings ORDER BY timestamp DESC LIMIT ?",(limit,))]
+    except sqlite3.Error:return[]
+
+def export_history():
+    try:return to_csv([dict(r) for r in history_db().execute("SELECT * FROM findings ORDER BY timestamp")])
+    except sqlite3.Error:return b""
+
+def append_history(rows,con=None):
     if not rows:return
-    existed=load_history();all_rows=existed+rows
-    hdr=["timestamp","target","suspect_domain","similarity","url"]
-    with open(HISTORY_FILE,"w",encoding="utf-8") as f:
-        f.write(",".join(hdr)+"\n")
-        for r in all_rows:f.write(",".join(str(r[h]) for h in hdr)+"\n")
+    with con or history_db() as c:
+        c.executemany("INSERT OR IGNORE INTO findings VALUES (:timestamp,:target,:suspect_domain,:similarity,:url)",rows)
 
 def to_csv(rows):
     if not rows:return b""
     hdr=["timestamp","target","suspect_domain","similarity","url"]
-    out=",".join(hdr)+"\n"
-    for r in rows:out+=",".join(str(r[h]) for h in hdr)+"\n"
-    return out.encode()
+    buf=io.StringIO();w=csv.DictWriter(buf,hdr,extrasaction="ignore",lineterminator="\n")
+    w.writeheader();w.writerows(rows)
+    return buf.getvalue().encode()
 
 def show_table(rows):
     if not rows:st.info("No suspicious lookalikes found.");return
     hdr=["When","Target","Suspect","Similarity","URL"]
-    st.write("| "+" | ".join(hdr)+" |");st.write("|"+"|".join(["---"]*len(hdr))+"|")
+    lines=["| "+" | ".join(hdr)+" |","|"+"|".join(["---"]*len(hdr))+"|"]
     for r in rows:
         when=time.strftime("%Y-%m-%d %H:%M",time.localtime(int(r["timestamp"])))
-        st.write(f"| {when} | {r['target']} | {r['suspect_domain']} | {r['similarity']} | {r['url']} |")
+        lines.append(f"| {when} | {r['target']} | {r['suspect_domain']} | {r['similarity']} | {r['url']} |")
+    st.markdown("\n".join(lines))
 
 st.set_page_config(page_title="CloneShield (Mini)",page_icon="🛡️",layout="centered")
 st.title("🛡️ CloneShield — Mini")
+if st.sidebar.button("Clear cache"):st.cache_data.clear();st.sidebar.success("Cache cleared.")
 
 tabs=st.tabs(["Scan","History"])
 with tabs[0]:
@@ -103,7 +228,8 @@ with tabs[0]:
             results=[];prog=st.progress(0)
             for i,t in enumerate(targets,start=1):
                 st.write(f"Scanning {t}…")
-                results+=scan_domain(t,threshold)
+                try:results+=scan_domain(t,threshold)
+                except FetchError:st.warning(f"Couldn't fetch {t}; skipped.")
                 prog.progress(i/len(targets))
             prog.empty();show_table(results)
             if results:
@@ -114,8 +240,7 @@ with tabs[1]:
     st.subheader("History")
     hist=load_history();show_table(hist)
     if hist:
-        st.download_button("Download Full History CSV",to_csv(hist),"history.csv","text/csv")
+        st.download_button("Download Full History CSV",export_history(),"history.csv","text/csv")
         if st.button("Clear History"):
-            import os
-            try:os.remove(HISTORY_FILE);st.success("History cleared. Refresh the page.")
-            except FileNotFoundError:st.info("History already empty.")
+            with history_db() as con:con.execute("DELETE FROM findings")
+            st.success("History cleared. Refresh the page.")